@@ -3,8 +3,16 @@ DNA Profiling Tool - Identifies individuals based on Short Tandem Repeats (STRs)
 """
 
 import csv
+import json
+import os
 import sys
 
+from sequence_utils import read_sequence, count_bases, sequence_id, memoized_scan
+
+# Parsed databases are cached in <database.csv>.dna.cache.json
+DB_CACHE_SUFFIX = '.dna.cache.json'
+DB_CACHE_VERSION = 2
+
 def main():
     # Check command-line arguments
     if len(sys.argv) != 3:
@@ -17,87 +25,135 @@ def main():
     print(f"Sequence: {sys.argv[2]}")
     print("-" * 40)
 
-    # Read database CSV file
-    database = []
-    with open(sys.argv[1], 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # Convert STR counts from strings to integers
-            for key in row:
-                if key != 'name':
-                    row[key] = int(row[key])
-            database.append(row)
+    # Read database CSV file (parsed once, then reused from a JSON cache)
+    database = load_db(sys.argv[1])
     
     print(f"📊 Loaded {len(database)} individuals from database")
 
-    # Read DNA sequence file
-    with open(sys.argv[2], 'r') as file:
-        dna_sequence = file.read().strip()
+    # Memory-map DNA sequence file
+    dna_sequence = read_sequence(sys.argv[2])
     
-    print(f"🧬 DNA sequence length: {len(dna_sequence)} bases")
+    print(f"🧬 DNA sequence length: {count_bases(dna_sequence)} bases")
 
     # Get list of STRs from database header (all columns except 'name')
     str_list = list(database[0].keys())[1:]
     print(f"🔍 Analyzing STRs: {', '.join(str_list)}")
 
-    # Calculate longest run for each STR
+    # Calculate longest run for each STR (memoized per sequence and STR)
+    seq_id = sequence_id(sys.argv[2])
     str_counts = {}
     for str_seq in str_list:
-        count = longest_match(dna_sequence, str_seq)
+        count = cached_longest_match(dna_sequence, seq_id, str_seq.encode())
         str_counts[str_seq] = count
         print(f"   {str_seq}: {count} repeats")
 
     print("\n📋 Comparing with database:")
 
-    # Check database for matching profile
+    # Check database for matching profile (output is buffered and
+    # written once, instead of a print per person and marker)
+    out = []
     for person in database:
         match = True
-        print(f"   {person['name']}: ", end="")
+        out.append(f"   {person['name']}: ")
         
         for str_seq in str_list:
             if person[str_seq] != str_counts[str_seq]:
                 match = False
-                print(f"❌ {str_seq}({person[str_seq]} vs {str_counts[str_seq]}) ", end="")
+                out.append(f"❌ {str_seq}({person[str_seq]} vs {str_counts[str_seq]}) ")
                 break
         
         if match:
-            print("✅ FULL MATCH!")
-            print(f"\n🎉 Match found: {person['name']}")
+            out.append("✅ FULL MATCH!\n")
+            out.append(f"\n🎉 Match found: {person['name']}\n")
+            sys.stdout.write("".join(out))
             return
         else:
-            print("❌ No match")
+            out.append("❌ No match\n")
 
     # No match found
-    print("\n❌ No matching individual found in database")
+    out.append("\n❌ No matching individual found in database\n")
+    sys.stdout.write("".join(out))
     return
 
 
+def load_db(path):
+    """
+    Returns the database CSV as a list of {name, STR: count} rows.
+    The parsed rows are saved as JSON next to the CSV and reused for as long
+    as the CSV's modification time and size are unchanged (JSON, not pickle,
+    so a planted cache file can never run code).
+    """
+    db_stat = os.stat(path)
+    cache_key = (DB_CACHE_VERSION, db_stat.st_mtime_ns, db_stat.st_size)
+    cache_path = path + DB_CACHE_SUFFIX
+
+    try:
+        with open(cache_path, 'r') as file:
+            cached = json.load(file)
+        if cached['key'] == list(cache_key):
+            return cached['database']
+    except Exception:
+        pass  # Missing, stale or unreadable cache: parse the CSV again
+
+    database = []
+    with open(path, 'r') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            # Convert STR counts from strings to integers
+            for key in row:
+                if key != 'name':
+                    row[key] = int(row[key])
+            database.append(row)
+
+    try:
+        with open(cache_path, 'w') as file:
+            json.dump({'key': list(cache_key), 'database': database}, file)
+    except OSError:
+        pass  # Read-only location: just skip caching
+
+    return database
+
+
+def cached_longest_match(sequence, seq_id, subsequence):
+    """
+    Memoized longest_match, keyed by sequence_id (None: not memoized)
+    """
+    return memoized_scan(seq_id, subsequence,
+                         lambda: longest_match(sequence, subsequence))
+
+
 def longest_match(sequence, subsequence):
     """
     Returns length of longest run of subsequence in sequence.
     """
-    longest_run = 0
-    sub_length = len(subsequence)
-    seq_length = len(sequence)
-
-    # Check each possible starting position
-    for i in range(seq_length):
-        count = 0
-        
-        # Keep checking consecutive matches
-        while True:
-            start = i + count * sub_length
-            end = start + sub_length
-            
-            if start + sub_length > seq_length:
-                break
-                
-            if sequence[start:end] == subsequence:
-                count += 1
-            else:
-                break
-        
-        longest_run = max(longest_run, count)
+    position = sequence.find(subsequence) if subsequence else -1
+    if position == -1:
+        return 0
+
+    # Double the run length until it no longer occurs in the sequence
+    # (the pattern is built by doubling, so this is O(log k) concatenations).
+    # A longer run starts with a shorter one, so it can never occur before
+    # the last hit: each search resumes there instead of at the start.
+    shortest_miss = 2
+    pattern = subsequence + subsequence
+    while True:
+        hit = sequence.find(pattern, position)
+        if hit == -1:
+            break
+        position = hit
+        shortest_miss *= 2
+        pattern = pattern + pattern
+
+    # Binary search between the last run that occurs and the first that doesn't
+    longest_run = shortest_miss // 2
+    while shortest_miss - longest_run > 1:
+        count = (longest_run + shortest_miss) // 2
+        hit = sequence.find(subsequence * count, position)
+        if hit != -1:
+            longest_run = count
+            position = hit
+        else:
+            shortest_miss = count
 
     return longest_run
 
@@ -4,9 +4,45 @@ Advanced DNA Profiling Tool
 """
 
 import csv
+import io
+import os
 import sys
 import math
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from sequence_utils import read_sequence, count_bases, sequence_id, memoized_scan
+
+try:
+    import ahocorasick  # pyahocorasick, optional single-pass STR scanner
+except ImportError:
+    ahocorasick = None
+
+try:
+    from numba import njit  # optional JIT for the per-marker STR scan
+except ImportError:
+    njit = None
+
+# Parsed databases are cached in <database.csv>.dna_advanced.cache.npz
+DB_CACHE_SUFFIX = '.dna_advanced.cache.npz'
+DB_CACHE_VERSION = 3
+
+# Markers whose values are sex-chromosome calls rather than repeat counts
+SPECIAL_MARKERS = ('AMEL',)
+
+# Longest marker whose window fits in one uint64 (8 bits per base)
+WINDOW_MAX_LENGTH = 8
+
+# Amelogenin primers (Sullivan et al., 1993). The amplicon is 106 bp on
+# AMELX and 112 bp on AMELY, which carries a 6 bp insertion. The reverse
+# primer is stored as the flank seen on the forward strand (its reverse
+# complement).
+AMEL_FORWARD_PRIMER = "CCCTGGGCTCTGTAAAGAATAGTG"
+AMEL_REVERSE_FLANK = "CAGCTTCCCAGTTTAAGCTCTGAT"
+AMEL_Y_LENGTH = 112
 
 def main():
     # Check command-line arguments
@@ -22,91 +58,73 @@ def main():
     print(f"Sequence: {sys.argv[2]}")
     print("-" * 60)
 
-    # Read database CSV file
-    database = []
-    with open(sys.argv[1], 'r') as file:
-        reader = csv.DictReader(file)
-        str_markers = reader.fieldnames[1:]  # All columns except 'name'
-        
-        for row in reader:
-            # Convert STR counts from strings to integers
-            for marker in str_markers:
-                if row[marker] not in ['X', 'Y']:  # Handle sex chromosomes
-                    row[marker] = int(row[marker])
-            database.append(row)
-    
-    print(f"📊 Loaded {len(database)} individuals from database")
+    # Read database CSV file (parsed once, then reused from an .npz cache)
+    str_markers, names, columns = load_db(sys.argv[1])
+    
+    print(f"📊 Loaded {len(names)} individuals from database")
     print(f"🧬 STR Markers: {len(str_markers)} markers (CODIS standard)")
     print(f"   Markers: {', '.join(str_markers[:5])}... (showing first 5)")
+    
+    # Repeat-count markers and sex-chromosome markers are handled separately
+    numeric_markers, special_markers = split_markers(str_markers)
 
-    # Read DNA sequence file
-    with open(sys.argv[2], 'r') as file:
-        dna_sequence = file.read().strip()
+    # Memory-map DNA sequence file
+    dna_sequence = read_sequence(sys.argv[2])
     
-    print(f"📏 DNA sequence length: {len(dna_sequence):,} bases")
+    print(f"📏 DNA sequence length: {count_bases(dna_sequence):,} bases")
 
     # Calculate longest run for each STR
     print("\n🔍 Analyzing STR repeats...")
-    str_counts = {}
+    str_counts = cached_str_repeats(
+        dna_sequence, sequence_id(sys.argv[2]), tuple(numeric_markers),
+        amelogenin='AMEL' in special_markers)
     
+    results = {marker: f"{str_counts[marker]} repeats" for marker in numeric_markers}
+    for marker in special_markers:
+        # Sex chromosomes (not STRs) come from the same scan
+        results[marker] = str_counts[marker]
     for marker in str_markers:
-        # Skip sex chromosomes (not STRs)
-        if marker == 'AMEL':
-            str_counts[marker] = analyze_amelogenin(dna_sequence)
-            print(f"   {marker}: {str_counts[marker]}")
-        else:
-            count = longest_match(dna_sequence, marker)
-            str_counts[marker] = count
-            print(f"   {marker}: {count} repeats")
+        print(f"   {marker}: {results[marker]}")
 
     print("\n📋 Matching against database...")
     
-    # Store all matches with similarity scores
+    # Stack the repeat-count columns once into an (individuals x markers) matrix
+    if numeric_markers:
+        db_matrix = np.column_stack([columns[marker] for marker in numeric_markers])
+    else:
+        db_matrix = np.zeros((len(names), 0), dtype=np.int16)
+    
+    # Score every person at once (allow small differences for degraded samples)
+    query = np.array([str_counts[marker] for marker in numeric_markers], dtype=np.int32)
+    diffs = np.abs(db_matrix - query)
+    match_scores = (diffs == 0).sum(axis=1) + 0.5 * ((diffs > 0) & (diffs <= 2)).sum(axis=1)
+    for marker in special_markers:
+        match_scores += columns[marker] == str_counts[marker]
+    
+    # Only the top matches are ranked and described
     matches = []
     
-    for person in database:
-        match_score = 0
-        mismatches = []
-        
-        for marker in str_markers:
-            if marker == 'AMEL':
-                if person[marker] == str_counts[marker]:
-                    match_score += 1
-                else:
-                    mismatches.append(marker)
-            else:
-                # Calculate similarity (allow small differences for degraded samples)
-                diff = abs(person[marker] - str_counts[marker])
-                if diff == 0:
-                    match_score += 1
-                elif diff <= 2:
-                    match_score += 0.5  # Partial match for degraded DNA
-                    mismatches.append(f"{marker}(+/-{diff})")
-                else:
-                    mismatches.append(f"{marker}({person[marker]}vs{str_counts[marker]})")
-        
-        similarity = (match_score / len(str_markers)) * 100
+    for index in top_match_indices(match_scores, 5, perfect_score=len(str_markers)):
+        similarity = (match_scores[index] / len(str_markers)) * 100
         matches.append({
-            'name': person['name'],
+            'name': names[index],
             'similarity': similarity,
-            'mismatches': mismatches
+            'mismatches': describe_mismatches(columns, str_markers, numeric_markers,
+                                              special_markers, str_counts, index)
         })
     
-    # Sort matches by similarity (highest first)
-    matches.sort(key=lambda x: x['similarity'], reverse=True)
-    
     # Display top matches
     print("\n" + "-" * 60)
     print("📊 MATCH RESULTS")
     print("-" * 60)
     
-    for i, match in enumerate(matches[:5]):  # Show top 5 matches
+    for i, match in enumerate(matches):  # Show top 5 matches
         print(f"\n{i+1}. {match['name']}")
         print(f"   Similarity: {match['similarity']:.1f}%")
         if match['mismatches'] and len(match['mismatches']) < 5:
             print(f"   Differences: {', '.join(match['mismatches'][:5])}")
         elif match['mismatches']:
-            print(f"   Differences: {', '.join(mismatches[:5])}...")
+            print(f"   Differences: {', '.join(match['mismatches'][:5])}...")
     
     # Determine if there's a match
     best_match = matches[0]
@@ -120,7 +138,7 @@ def main():
         print(f"   Confidence: {best_match['similarity']:.1f}%")
         
         # Calculate random match probability
-        probability = calculate_match_probability(str_counts, str_markers)
+        probability = calculate_match_probability(str_counts, numeric_markers)
         print(f"\n📈 Random Match Probability: 1 in {probability:,.0f}")
         
         if probability > 1e9:
@@ -137,39 +155,334 @@ def main():
     print("\n" + "="*60)
 
 
-def longest_match(sequence, subsequence):
+def top_match_indices(scores, k, perfect_score=None):
     """
-    Returns length of longest run of subsequence in sequence.
-    Optimized for multiple STR markers.
+    Returns the indices of the k highest scores, best first.
+    Ties keep database order, the same as a stable sort of every score.
     """
-    longest_run = 0
-    sub_length = len(subsequence)
-    seq_length = len(sequence)
+    # Enough full matches: they are the top k, nothing needs ranking
+    if perfect_score is not None:
+        perfect = np.flatnonzero(scores >= perfect_score)
+        if len(perfect) >= k:
+            return perfect[:k]
 
-    # Early exit if subsequence longer than sequence
-    if sub_length > seq_length:
-        return 0
+    if len(scores) <= k:
+        return np.argsort(-scores, kind='stable')
 
-    # Use a sliding window approach
-    i = 0
-    while i < seq_length - sub_length:
-        count = 0
-        
-        # Check consecutive matches
-        while i + (count + 1) * sub_length <= seq_length:
-            start = i + count * sub_length
-            end = start + sub_length
-            
-            if sequence[start:end] == subsequence:
-                count += 1
-            else:
-                break
-        
-        if count > 0:
-            longest_run = max(longest_run, count)
-            i += count * sub_length  # Skip past this run
+    # argpartition finds the k-th best score without sorting everyone
+    kth_score = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > kth_score)
+    tied = np.flatnonzero(scores == kth_score)[:k - len(above)]
+    top = np.concatenate((above, tied))
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def describe_mismatches(columns, str_markers, numeric_markers, special_markers,
+                        str_counts, index):
+    """
+    Lists the markers where person `index` differs from the sample
+    (numeric_markers/special_markers as split once by split_markers)
+    """
+    mismatches = {}
+    
+    for marker in numeric_markers:
+        value = columns[marker][index]
+        diff = abs(int(value) - str_counts[marker])
+        if 0 < diff <= 2:
+            mismatches[marker] = f"{marker}(+/-{diff})"  # Partial match for degraded DNA
+        elif diff > 2:
+            mismatches[marker] = f"{marker}({value}vs{str_counts[marker]})"
+
+    for marker in special_markers:
+        if columns[marker][index] != str_counts[marker]:
+            mismatches[marker] = marker
+
+    # Report in database column order
+    return [mismatches[marker] for marker in str_markers if marker in mismatches]
+
+
+def split_markers(str_markers):
+    """
+    Returns (numeric_markers, special_markers): the markers with repeat
+    counts, and the sex-chromosome markers (AMEL) with 'X'/'Y' values
+    """
+    numeric_markers = [marker for marker in str_markers if marker not in SPECIAL_MARKERS]
+    special_markers = [marker for marker in str_markers if marker in SPECIAL_MARKERS]
+    return numeric_markers, special_markers
+
+
+def load_db(path):
+    """
+    Returns (str_markers, names, columns) parsed from the database CSV,
+    where columns maps each marker to a NumPy array of every person's value.
+    The parsed result is saved as a .npz next to the CSV and reused for as
+    long as the CSV's modification time and size are unchanged. The cache
+    is loaded with allow_pickle=False, so it can only ever hold arrays.
+    """
+    db_stat = os.stat(path)
+    cache_key = (DB_CACHE_VERSION, db_stat.st_mtime_ns, db_stat.st_size)
+    cache_path = path + DB_CACHE_SUFFIX
+
+    try:
+        with np.load(cache_path, allow_pickle=False) as cached:
+            if tuple(cached['key'].tolist()) == cache_key:
+                str_markers = cached['str_markers'].tolist()
+                names = cached['names'].tolist()
+                numeric_markers, special_markers = split_markers(str_markers)
+                columns = {}
+                for j, marker in enumerate(str_markers):
+                    columns[marker] = cached[f'column_{j}']
+                for marker in special_markers:
+                    columns[marker] = columns[marker].astype(object)
+                return str_markers, names, columns
+    except Exception:
+        pass  # Missing, stale or unreadable cache: parse the CSV again
+
+    # Column per marker (SoA): {marker: array of every person's value}
+    with open(path, 'r', newline='') as file:
+        header = next(csv.reader(file))
+        str_markers = header[1:]  # All columns except 'name'
+        rows = file.read()
+
+    if rows.strip():
+        # numpy parses the cells in C, one row per person ('#' is data, not
+        # a comment, the same as for csv.DictReader)
+        table = np.loadtxt(io.StringIO(rows), delimiter=',', quotechar='"',
+                           comments=None, dtype=str, ndmin=2)
+    else:
+        table = np.empty((0, len(header)), dtype=str)
+
+    names = table[:, 0].tolist()
+    column_of = {marker: j for j, marker in enumerate(str_markers, start=1)}
+    numeric_markers, special_markers = split_markers(str_markers)
+    columns = {}
+    for marker in numeric_markers:
+        # Convert STR counts from strings to integers
+        columns[marker] = table[:, column_of[marker]].astype(np.int16)
+    for marker in special_markers:
+        # Sex chromosomes stay as 'X'/'Y' strings
+        columns[marker] = table[:, column_of[marker]].astype(object)
+
+    # Special columns are stored as str arrays, everything loads without pickle
+    arrays = {f'column_{j}': columns[marker].astype(str) if marker in special_markers
+              else columns[marker]
+              for j, marker in enumerate(str_markers)}
+    try:
+        with open(cache_path, 'wb') as file:
+            np.savez(file, key=np.array(cache_key, dtype=np.int64),
+                     str_markers=np.array(str_markers, dtype=str),
+                     names=np.array(names, dtype=str), **arrays)
+    except OSError:
+        pass  # Read-only location: just skip caching
+
+    return str_markers, names, columns
+
+
+def cached_str_repeats(sequence, seq_id, markers, amelogenin=False):
+    """
+    Memoized count_str_repeats, keyed by sequence_id (None: not memoized)
+    and a tuple of markers. Returns a fresh dict, which the caller may add to.
+    """
+    str_counts = memoized_scan(
+        seq_id, (markers, amelogenin),
+        lambda: count_str_repeats(sequence, list(markers), amelogenin))
+    return dict(str_counts)
+
+
+def count_str_repeats(sequence, markers, amelogenin=False):
+    """
+    Returns {marker: longest run} for every STR marker, plus the AMEL
+    call ('XX' or 'XY') when amelogenin is set.
+    Scans each marker on its own thread, except that without Numba (whose
+    compiled scans are faster) it uses one Aho-Corasick pass over the
+    sequence for all markers and the AMEL flanks when pyahocorasick is
+    installed.
+    """
+    if njit is not None or ahocorasick is None or not (markers or amelogenin):
+        codes = encode_sequence(sequence)
+        # Markers are independent and the NumPy/Numba scans release the GIL,
+        # so scan them on parallel threads sharing the same encoded buffer
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            counts = executor.map(lambda marker: longest_match(codes, marker), markers)
+            str_counts = dict(zip(markers, counts))
+        if amelogenin:
+            str_counts['AMEL'] = analyze_amelogenin(sequence)
+        return str_counts
+
+    # Words map to (kind, marker) so a flank can never be taken for an STR
+    automaton = ahocorasick.Automaton()
+    for marker in markers:
+        automaton.add_word(marker, ('str', marker))
+    if amelogenin:
+        automaton.add_word(AMEL_FORWARD_PRIMER, ('forward', AMEL_FORWARD_PRIMER))
+        automaton.add_word(AMEL_REVERSE_FLANK, ('reverse', AMEL_REVERSE_FLANK))
+    automaton.make_automaton()
+
+    # runs[marker][start] = consecutive repeats ending with the hit at start
+    runs = {marker: {} for marker in markers}
+    str_counts = {marker: 0 for marker in markers}
+    forward_starts = []
+    reverse_ends = []
+
+    # pyahocorasick only scans str, so this path decodes the bytes once
+    # (latin-1 maps each byte to one character: offsets match and it never fails)
+    if not isinstance(sequence, str):
+        sequence = str(sequence, 'latin-1')
+
+    # Hits arrive in order of end position, so the previous repeat of a
+    # run (len(marker) bases earlier) has always been seen already
+    for end, (kind, marker) in automaton.iter(sequence):
+        sub_length = len(marker)
+        start = end - sub_length + 1
+        if kind == 'forward':
+            forward_starts.append(start)
+        elif kind == 'reverse':
+            reverse_ends.append(end + 1)
         else:
-            i += 1
+            marker_runs = runs[marker]
+            count = marker_runs.get(start - sub_length, 0) + 1
+            marker_runs[start] = count
+            if count > str_counts[marker]:
+                str_counts[marker] = count
+
+    if amelogenin:
+        str_counts['AMEL'] = call_amelogenin(forward_starts, reverse_ends)
+    return str_counts
+
+
+def encode_sequence(sequence):
+    """
+    Returns the sequence as a uint8 NumPy array (one byte per base).
+    Bytes-like sequences (such as the memory-mapped file) are not copied.
+    """
+    if isinstance(sequence, str):
+        sequence = sequence.encode()
+    return np.frombuffer(sequence, dtype=np.uint8)
+
+
+if njit is not None:
+    @njit(cache=True, boundscheck=False, nogil=True)
+    def _bmh_skip_table(pattern):
+        """
+        Boyer-Moore-Horspool bad-character table: how far the window may
+        shift given the byte under its last position
+        """
+        sub_length = len(pattern)
+        skip = np.full(256, sub_length, dtype=np.int64)
+        for k in range(sub_length - 1):
+            skip[pattern[k]] = sub_length - 1 - k
+        return skip
+
+    @njit(cache=True, boundscheck=False, nogil=True)
+    def _longest_run_jit(codes, pattern):
+        """
+        Compiled scan loop for longest_match: a Boyer-Moore-Horspool search
+        that jumps over windows which cannot match
+        """
+        sub_length = len(pattern)
+        last_window = len(codes) - sub_length
+        skip = _bmh_skip_table(pattern)
+        longest_run = 0
+
+        # Per alignment (start % sub_length): where its latest hit started
+        # and the run that hit ends. Skipped windows never need visiting.
+        last_start = np.full(sub_length, -1, dtype=np.int64)
+        runs = np.zeros(sub_length, dtype=np.int64)
+
+        i = 0
+        while i <= last_window:
+            j = sub_length - 1
+            while j >= 0 and codes[i + j] == pattern[j]:
+                j -= 1
+
+            if j < 0:
+                slot = i % sub_length
+                if last_start[slot] == i - sub_length:
+                    runs[slot] += 1
+                else:
+                    runs[slot] = 1
+                last_start[slot] = i
+                longest_run = max(longest_run, runs[slot])
+
+            # The shift is safe after a hit too, so overlapping hits are seen
+            i += skip[codes[i + sub_length - 1]]
+
+        return longest_run
+
+    @lru_cache(maxsize=None)
+    def _packed_kernel(sub_length):
+        """
+        Compiled scan loop for markers of up to WINDOW_MAX_LENGTH bases,
+        generated once per marker length: sub_length is a compile-time
+        constant, so the mask and the modulo below are folded by LLVM.
+        The current window is kept packed in one uint64 (8 bits per base),
+        so each step is a shift, an OR and a single integer compare.
+        """
+        mask = np.uint64(0xFFFFFFFFFFFFFFFF) >> np.uint64(64 - 8 * sub_length)
+
+        @njit(cache=True, boundscheck=False, nogil=True)
+        def longest_run_packed(codes, pattern_word):
+            window = np.uint64(0)
+            longest_run = 0
+
+            # runs[i % sub_length] = run ending with the window at i, so the
+            # slot still holds the run of the window sub_length bases earlier
+            runs = np.zeros(sub_length, dtype=np.int64)
+
+            for end in range(len(codes)):
+                window = ((window << np.uint64(8)) | np.uint64(codes[end])) & mask
+
+                start = end - sub_length + 1
+                if start < 0:
+                    continue
+
+                slot = start % sub_length
+                if window == pattern_word:
+                    runs[slot] += 1
+                    longest_run = max(longest_run, runs[slot])
+                else:
+                    runs[slot] = 0
+
+            return longest_run
+
+        return longest_run_packed
+else:
+    _longest_run_jit = None
+    _packed_kernel = None
+
+
+def longest_match(codes, subsequence):
+    """
+    Returns length of longest run of subsequence in an encoded sequence.
+    Runs a Numba-compiled loop when numba is installed, otherwise
+    vectorized with NumPy: every position is compared at once in C.
+    """
+    pattern = encode_sequence(subsequence)
+    sub_length = len(pattern)
+    n_windows = len(codes) - sub_length + 1
+
+    if sub_length == 0 or n_windows <= 0:
+        return 0
+
+    if _longest_run_jit is not None:
+        if sub_length <= WINDOW_MAX_LENGTH:
+            pattern_word = np.uint64(int.from_bytes(pattern.tobytes(), 'big'))
+            return _packed_kernel(sub_length)(codes, pattern_word)
+        return _longest_run_jit(codes, pattern)
+
+    # hits[i] is True when the subsequence starts at position i
+    hits = codes[:n_windows] == pattern[0]
+    for j in range(1, sub_length):
+        hits &= codes[j:j + n_windows] == pattern[j]
+
+    # A run is a streak of hits sub_length apart, so look for the longest
+    # streak within each of the sub_length alignments
+    longest_run = 0
+    for offset in range(sub_length):
+        aligned = hits[offset::sub_length].astype(np.int8)
+        edges = np.flatnonzero(np.diff(aligned, prepend=0, append=0))
+        if len(edges):
+            longest_run = max(longest_run, int((edges[1::2] - edges[::2]).max()))
 
     return longest_run
 
@@ -177,31 +490,63 @@ def longest_match(sequence, subsequence):
 def analyze_amelogenin(sequence):
     """
     Determine sex from AMEL marker
-    X: 212bp, Y: 218bp fragments
+    X: 106bp, Y: 112bp amplicons between the AMEL primers
+    """
+    forward_starts = find_all(sequence, AMEL_FORWARD_PRIMER)
+    reverse_ends = [start + len(AMEL_REVERSE_FLANK)
+                    for start in find_all(sequence, AMEL_REVERSE_FLANK)]
+    return call_amelogenin(forward_starts, reverse_ends)
+
+
+def call_amelogenin(forward_starts, reverse_ends):
+    """
+    Returns 'XY' when a forward primer site and a reverse flank end are the
+    AMELY amplicon length apart, otherwise 'XX'
     """
-    # Simplified: check for Y chromosome markers
-    if "Y" in sequence or "TAT" in sequence:  # Simplified detection
-        return "XY"
+    reverse_ends = set(reverse_ends)
+    for start in forward_starts:
+        if start + AMEL_Y_LENGTH in reverse_ends:
+            return "XY"
     return "XX"
 
 
-def calculate_match_probability(str_counts, markers):
+def find_all(sequence, motif):
+    """
+    Returns the start of every (possibly overlapping) occurrence of motif
+    """
+    # The sequence may be str or bytes-like (the memory-mapped file)
+    if not isinstance(sequence, str):
+        motif = motif.encode()
+    starts = []
+    start = sequence.find(motif)
+    while start != -1:
+        starts.append(start)
+        start = sequence.find(motif, start + 1)
+    return starts
+
+
+def calculate_match_probability(str_counts, markers, freq_table=None):
     """
-    Calculate random match probability using product rule
+    Calculate random match probability over the repeat-count markers using
+    product rule, summed as logs so large panels cannot underflow to zero
     Simplified allele frequencies (in reality would use population database)
     """
-    probability = 1.0
+    if freq_table is None:
+        freq_table = {}
     
     # Typical allele frequencies for common STRs (simplified)
+    log_inverse = 0.0
     for marker in markers:
-        if marker == 'AMEL':
-            continue
-        # Assume average allele frequency of 0.1 for simplicity
-        freq = 0.1
-        probability *= freq
+        if marker in SPECIAL_MARKERS:
+            continue  # Sex chromosomes carry no repeat-count frequency
+        # Assume average allele frequency of 0.1 unless the table has one
+        log_inverse -= math.log10(freq_table.get(marker, 0.1))
     
     # Convert to 1 in X format
-    return int(1 / probability)
+    try:
+        return 10.0 ** log_inverse
+    except OverflowError:
+        return math.inf
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+"""
+Sequence file helpers shared by dna.py and dna_advanced.py
+(standard library only, so dna.py still runs without NumPy)
+"""
+
+import mmap
+import os
+import stat
+from collections import OrderedDict
+
+# Bytes that bytes.strip() would remove around a sequence
+WHITESPACE = b" \t\n\r\x0b\x0c"
+
+# Memoized scan results (never the sequences themselves), oldest first
+_scan_cache = OrderedDict()
+SCAN_CACHE_SIZE = 4096
+
+
+def read_sequence(path):
+    """
+    Returns the DNA sequence file as a read-only memory map (bytes-like),
+    so the sequence is never copied into a Python string.
+    Pipes and other non-regular files cannot be mapped and are read instead.
+    """
+    with open(path, 'rb') as file:
+        file_stat = os.fstat(file.fileno())
+        if not stat.S_ISREG(file_stat.st_mode):
+            return file.read()
+        if file_stat.st_size == 0:
+            return b""  # Empty files cannot be memory-mapped
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def count_bases(sequence):
+    """
+    Returns the length of the sequence ignoring surrounding whitespace
+    (the same as len(sequence.strip()), without copying it)
+    """
+    start, end = 0, len(sequence)
+    while end > start and sequence[end - 1] in WHITESPACE:
+        end -= 1
+    while start < end and sequence[start] in WHITESPACE:
+        start += 1
+    return end - start
+
+
+def sequence_id(path):
+    """
+    Returns the key memoized scans of a sequence file are stored under:
+    the file's identity and modification stamp, so no extra pass over the
+    sequence is needed. None for pipes and other non-regular files, whose
+    scans are never memoized.
+    """
+    file_stat = os.stat(path)
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+    return (file_stat.st_dev, file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def memoized_scan(seq_id, key, scan):
+    """
+    Returns scan() for the sequence identified by seq_id (see sequence_id),
+    reusing an earlier result stored under the same key. Nothing is
+    memoized when seq_id is None. Only the SCAN_CACHE_SIZE most recently
+    used results are kept.
+    """
+    key = (seq_id, key)
+    if seq_id is not None and key in _scan_cache:
+        _scan_cache.move_to_end(key)
+        return _scan_cache[key]
+
+    result = scan()
+    if seq_id is not None:
+        _scan_cache[key] = result
+        if len(_scan_cache) > SCAN_CACHE_SIZE:
+            _scan_cache.popitem(last=False)
+    return result
@@ -10,34 +10,57 @@ import sys
 import datetime
 import os
 
+from dna_advanced import load_db
+
 def load_profile_from_csv(csv_file, person_name):
     """
     Load a person's DNA profile from the database CSV
     """
     try:
-        with open(csv_file, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row['name'].lower() == person_name.lower():
-                    # Convert STR counts to integers
-                    profile = {}
-                    for key, value in row.items():
-                        if key == 'name':
-                            profile[key] = value
-                        elif value not in ['X', 'Y']:
-                            try:
-                                profile[key] = int(value)
-                            except:
-                                profile[key] = value
-                        else:
-                            profile[key] = value
-                    return profile
+        try:
+            str_markers, names, columns = load_db(csv_file)  # reuses dna_advanced's on-disk cache
+        except ValueError:
+            # Some cell is not a repeat count: read the CSV cell by cell instead
+            return load_profile_tolerant(csv_file, person_name)
+        for index, name in enumerate(names):
+            if name.lower() == person_name.lower():
+                profile = {'name': name}
+                for marker in str_markers:
+                    value = columns[marker][index]
+                    # item() gives plain ints instead of NumPy scalars
+                    profile[marker] = value.item() if isinstance(value, np.generic) else value
+                return profile
         print(f"❌ Person '{person_name}' not found in database")
         return None
     except Exception as e:
         print(f"❌ Error loading database: {e}")
         return None
 
+def load_profile_tolerant(csv_file, person_name):
+    """
+    Load a person's DNA profile straight from the CSV, keeping any cell
+    that is not a number as a string
+    """
+    with open(csv_file, 'r') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            if row['name'].lower() == person_name.lower():
+                # Convert STR counts to integers
+                profile = {}
+                for key, value in row.items():
+                    if key == 'name':
+                        profile[key] = value
+                    elif value not in ['X', 'Y']:
+                        try:
+                            profile[key] = int(value)
+                        except:
+                            profile[key] = value
+                    else:
+                        profile[key] = value
+                return profile
+    print(f"❌ Person '{person_name}' not found in database")
+    return None
+
 def create_electropherogram(profile_data, title="DNA Profile", save_path=None):
     """
     Create a forensic-style electropherogram visualization
@@ -70,16 +93,18 @@ def create_electropherogram(profile_data, title="DNA Profile", save_path=None):
     # Top plot: Allele peaks (electropherogram)
     max_allele = max(alleles) if alleles else 30
     
+    # Create all peak shapes (Gaussians) at once: one row per marker
+    x_positions = np.arange(1, len(markers) + 1)
+    x_peaks = np.linspace(-0.3, 0.3, 50)[None, :] + x_positions[:, None]
+    peak_heights = np.array(alleles) / max_allele * 100
+    y_peaks = peak_heights[:, None] * np.exp(-((x_peaks - x_positions[:, None]) ** 2) / 0.02)
+    
     for i, (marker, allele) in enumerate(zip(markers, alleles)):
         x_pos = i + 1
-        
-        # Create peak shape (Gaussian)
-        x_peak = np.linspace(x_pos - 0.3, x_pos + 0.3, 50)
-        peak_height = (allele / max_allele) * 100
-        y_peak = peak_height * np.exp(-((x_peak - x_pos) ** 2) / 0.02)
+        peak_height = peak_heights[i]
         
         # Plot peak
-        ax1.fill_between(x_peak, 0, y_peak, color=colors[i], alpha=0.8)
+        ax1.fill_between(x_peaks[i], 0, y_peaks[i], color=colors[i], alpha=0.8)
         
         # Add allele value label
         ax1.text(x_pos, peak_height + 5, str(allele), 